@@ -6,7 +6,10 @@ app = marimo.App(width="medium")
 with app.setup:
     import marimo as mo
     import polars as pl
+    import re
+    from dataclasses import dataclass
     from categorize_organizations import CATEGORIES
+    from facets import LOCATION_SCHEMA
 
     cols_to_drop = [
         "reference_num",
@@ -17,6 +20,15 @@ with app.setup:
         "classification",
     ]
 
+    # Name matches outrank address matches. A row must contain every query word, where a word
+    # counts as present if at least MIN_WORD_MATCH of its trigrams are found, so typos still match
+    NAME_WEIGHT = 1.0
+    ADDRESS_WEIGHT = 0.5
+    MIN_WORD_MATCH = 0.5
+
+    # Status is not a facet here, prepare_dataset keeps approved organizations only
+    FACETS = ["state", "postcode", "category"]
+
 
 @app.cell(hide_code=True)
 def _(inputs):
@@ -48,10 +60,19 @@ def _():
 
 
 @app.cell
-def _(filter_dataset):
-    subsection_446 = pl.read_csv(
-        f"{mo.notebook_location()}/public/generated/subsection_44_6/subsection_44_6.csv"
-    ).pipe(filter_dataset)
+def _():
+    subsection_446_data = pl.read_csv(
+        f"{mo.notebook_location()}/public/generated/subsection_44_6/subsection_44_6.csv",
+        schema_overrides=LOCATION_SCHEMA,
+    ).pipe(prepare_dataset)
+    subsection_446_index = SearchIndex.build(subsection_446_data)
+    subsection_446_facets = FacetIndex.build(subsection_446_data)
+    return subsection_446_data, subsection_446_facets, subsection_446_index
+
+
+@app.cell
+def _(filter_dataset, subsection_446_data, subsection_446_facets, subsection_446_index):
+    subsection_446 = filter_dataset(subsection_446_data, subsection_446_index, subsection_446_facets)
     mo.ui.table(
         subsection_446,
         page_size=10,
@@ -78,10 +99,19 @@ def _():
 
 
 @app.cell
-def _(filter_dataset):
-    subsection_11D = pl.read_csv(
-        f"{mo.notebook_location()}/public/generated/subsection_11D/subsection_11D.csv"
-    ).pipe(filter_dataset)
+def _():
+    subsection_11D_data = pl.read_csv(
+        f"{mo.notebook_location()}/public/generated/subsection_11D/subsection_11D.csv",
+        schema_overrides=LOCATION_SCHEMA,
+    ).pipe(prepare_dataset)
+    subsection_11D_index = SearchIndex.build(subsection_11D_data)
+    subsection_11D_facets = FacetIndex.build(subsection_11D_data)
+    return subsection_11D_data, subsection_11D_facets, subsection_11D_index
+
+
+@app.cell
+def _(filter_dataset, subsection_11D_data, subsection_11D_facets, subsection_11D_index):
+    subsection_11D = filter_dataset(subsection_11D_data, subsection_11D_index, subsection_11D_facets)
     mo.ui.table(
         subsection_11D,
         page_size=10,
@@ -104,30 +134,179 @@ def _():
 
 
 @app.cell
-def _(filter_dataset):
-    subsection_pua = pl.read_csv(
-        f"{mo.notebook_location()}/public/generated/subsection_PUA/subsection_pua.csv"
-    ).pipe(filter_dataset)
+def _():
+    subsection_pua_data = pl.read_csv(
+        f"{mo.notebook_location()}/public/generated/subsection_PUA/subsection_pua.csv",
+        schema_overrides=LOCATION_SCHEMA,
+    ).pipe(prepare_dataset)
+    subsection_pua_index = SearchIndex.build(subsection_pua_data)
+    subsection_pua_facets = FacetIndex.build(subsection_pua_data)
+    return subsection_pua_data, subsection_pua_facets, subsection_pua_index
+
+
+@app.cell
+def _(filter_dataset, subsection_pua_data, subsection_pua_facets, subsection_pua_index):
+    subsection_pua = filter_dataset(subsection_pua_data, subsection_pua_index, subsection_pua_facets)
     mo.ui.table(subsection_pua, selection=None, wrapped_columns=["organization"])
     return (subsection_pua,)
 
 
-@app.cell
-def _(dropdown, search_input):
-    def filter_dataset(df: pl.DataFrame) -> pl.DataFrame:
-        df = df.filter(pl.col("status") == "approved").drop(cols_to_drop)
-        df = df.with_columns(pl.col("*").str.to_titlecase())
-        search = search_input.value.lower()
-        conditions = [
-            pl.col(col).str.to_lowercase().str.contains(search)
-            for col in df.columns
-        ]
-        df = df.filter(pl.any_horizontal(conditions))
+@app.function
+def prepare_dataset(df: pl.DataFrame) -> pl.DataFrame:
+    df = df.filter(pl.col("status") == "approved").drop(cols_to_drop)
+    return df.with_columns(pl.col("*").str.to_titlecase())
+
+
+@app.function
+def word_trigrams(text: str) -> list[set[str]]:
+    """Padded trigrams of each distinct word of text, so a typo only costs the few grams around it"""
+    words = dict.fromkeys(re.sub(r"[^0-9a-z]+", " ", text.lower()).split())
+    return [{f"  {word} "[i : i + 3] for i in range(len(word) + 1)} for word in words]
+
+
+@app.class_definition
+@dataclass
+class SearchIndex:
+    """Trigram index over organization name and address, built once per dataset"""
+
+    # (trigram, row, weight) sorted by trigram, so each trigram's postings are one contiguous slice
+    postings: pl.DataFrame
+    offsets: dict[str, tuple[int, int]]
+    # (row, name_size) number of distinct trigrams in each row's name, so shorter names rank first
+    name_sizes: pl.DataFrame
+
+    @classmethod
+    def build(cls, df: pl.DataFrame) -> "SearchIndex":
+        def _grams(column: str, weight: float) -> pl.LazyFrame:
+            return (
+                df.lazy()
+                .select(
+                    pl.int_range(pl.len(), dtype=pl.UInt32).alias("row"),
+                    pl.col(column)
+                    .fill_null("")
+                    .str.to_lowercase()
+                    .str.replace_all(r"[^0-9a-z]+", " ")
+                    .str.split(" ")
+                    .alias("word"),
+                )
+                .explode("word")
+                .filter(pl.col("word") != "")
+                .select("row", ("  " + pl.col("word") + " ").alias("word"))
+                .with_columns(pl.int_ranges(0, pl.col("word").str.len_chars() - 2).alias("offset"))
+                .explode("offset")
+                .select(
+                    pl.col("word").str.slice(pl.col("offset"), 3).alias("trigram"),
+                    "row",
+                    pl.lit(weight).alias("weight"),
+                )
+            )
+
+        name_grams = _grams("organization", NAME_WEIGHT)
+        postings = (
+            pl.concat([name_grams, _grams("address", ADDRESS_WEIGHT)])
+            .group_by("trigram", "row")
+            .agg(pl.col("weight").max())
+            .sort("trigram", "row")
+            .collect()
+        )
+        name_sizes = name_grams.group_by("row").agg(pl.col("trigram").n_unique().alias("name_size")).collect()
+        counts = postings.group_by("trigram", maintain_order=True).len()
+        starts = counts["len"].cum_sum() - counts["len"]
+        offsets = {
+            trigram: (start, length)
+            for trigram, start, length in zip(counts["trigram"], starts, counts["len"])
+        }
+        return cls(postings=postings, offsets=offsets, name_sizes=name_sizes)
+
+    def search(self, query: str) -> pl.DataFrame:
+        """
+        Rows containing every word of query as (row, score), best first.
+
+        Score is the Dice coefficient of the query's trigrams and the row's name trigrams, with
+        address matches weighted down, so short names matching the whole query rank first.
+        """
+        words = word_trigrams(query)
+        query_grams = pl.DataFrame(
+            [(word, gram) for word, grams in enumerate(words) for gram in grams],
+            schema={"word": pl.UInt32, "trigram": pl.Utf8},
+            orient="row",
+        )
+        grams = set(query_grams["trigram"])
+        hits = [self.postings.slice(*self.offsets[g]) for g in grams if g in self.offsets]
+        if not hits:
+            return pl.DataFrame(schema={"row": pl.UInt32, "score": pl.Float64})
+
+        hits = pl.concat(hits)
+        word_sizes = query_grams.group_by("word").len("word_size")
+        rows = (
+            hits.join(query_grams, on="trigram")
+            .group_by("row", "word")
+            .len()
+            .join(word_sizes, on="word")
+            .filter(pl.col("len") / pl.col("word_size") >= MIN_WORD_MATCH)
+            .group_by("row")
+            .len()
+            .filter(pl.col("len") == len(words))
+            .select("row")
+        )
+        return (
+            hits.join(rows, on="row")
+            .group_by("row")
+            .agg(pl.col("weight").sum())
+            .join(self.name_sizes, on="row", how="left")
+            .select("row", (2 * pl.col("weight") / (len(grams) + pl.col("name_size").fill_null(0))).alias("score"))
+            .sort(["score", "row"], descending=[True, False])
+        )
+
+
+@app.class_definition
+@dataclass
+class FacetIndex:
+    """Rows holding each value of each facet column, built once per dataset"""
+
+    rows: dict[str, dict[str, pl.Series]]
+
+    @classmethod
+    def build(cls, df: pl.DataFrame) -> "FacetIndex":
+        indexed = df.select(pl.int_range(pl.len(), dtype=pl.UInt32).alias("row"), *FACETS)
+        rows = {}
+        for facet in FACETS:
+            grouped = indexed.drop_nulls(facet).group_by(facet).agg(pl.col("row"))
+            rows[facet] = dict(zip(grouped[facet], grouped["row"]))
+        return cls(rows=rows)
+
+    def counts(self, facet: str) -> dict[str, int]:
+        """Number of rows with each value of facet"""
+        return {value: len(rows) for value, rows in self.rows[facet].items()}
+
+    def matching(self, selected: dict[str, list[str]]) -> pl.Series | None:
+        """Rows having one of the selected values of every facet in selected, or None if selected is empty"""
+        matched = None
+        for facet, values in selected.items():
+            # A row has one value per facet, so the rows of different values never overlap
+            hits = [self.rows[facet][value] for value in values if value in self.rows[facet]]
+            facet_rows = pl.concat(hits) if hits else pl.Series("row", [], pl.UInt32)
+            matched = facet_rows if matched is None else matched.filter(matched.is_in(facet_rows.implode()))
+        return matched
 
-        if dropdown.value != len(CATEGORIES):
-            return df.filter(pl.col("category").is_in(dropdown.value))
 
-        return df
+@app.cell
+def _(dropdown, postcode_select, search_input, state_select):
+    def filter_dataset(df: pl.DataFrame, index: SearchIndex, facets: FacetIndex) -> pl.DataFrame:
+        selected = {
+            facet: values
+            for facet, values in [("state", state_select.value), ("postcode", postcode_select.value)]
+            if values
+        }
+        if len(dropdown.value) != len(CATEGORIES):
+            selected["category"] = dropdown.value
+
+        rows = index.search(search_input.value)["row"] if search_input.value.strip() else None
+        matched = facets.matching(selected)
+        if matched is not None:
+            rows = matched.sort() if rows is None else rows.filter(rows.is_in(matched.implode()))
+
+        return df if rows is None else df.select(pl.all().gather(rows))
     return (filter_dataset,)
 
 
@@ -141,10 +320,27 @@ def _():
     return dropdown, dropdown_wrap, search_input
 
 
+@app.cell
+def _(subsection_11D_facets, subsection_446_facets, subsection_pua_facets):
+    def _options(facet: str, by_count: bool) -> dict[str, str]:
+        totals: dict[str, int] = {}
+        for facets in [subsection_446_facets, subsection_11D_facets, subsection_pua_facets]:
+            for value, count in facets.counts(facet).items():
+                totals[value] = totals.get(value, 0) + count
+        ordered = sorted(totals.items(), key=lambda item: (-item[1], item[0]) if by_count else item[0])
+        return {f"{value} ({count})": value for value, count in ordered}
+
+    state_select = mo.ui.multiselect(options=_options("state", by_count=True), label="States")
+    postcode_select = mo.ui.multiselect(options=_options("postcode", by_count=False), label="Postcodes")
+    return postcode_select, state_select
+
+
 @app.cell
 def _(
     dropdown_wrap,
+    postcode_select,
     search_input,
+    state_select,
     subsection_11D,
     subsection_446,
     subsection_pua,
@@ -153,7 +349,25 @@ def _(
     num_orgs = mo.Html(
         f"<span style='color: green; font-weight: bold;'>{_total}</span>"
     )
-    inputs = mo.vstack([mo.md(f"{search_input} {num_orgs}"), dropdown_wrap])
+    # Live counts of the current matches, grouped on the precomputed state column
+    _by_state = (
+        pl.concat([df.select("state") for df in [subsection_446, subsection_11D, subsection_pua]])
+        .drop_nulls()
+        .group_by("state")
+        .len()
+        .sort(["len", "state"], descending=[True, False])
+    )
+    state_counts = mo.md(
+        " · ".join(f"{state} **{count}**" for state, count in _by_state.iter_rows())
+    ).style({"font-size": "0.85em"})
+    inputs = mo.vstack(
+        [
+            mo.md(f"{search_input} {num_orgs}"),
+            dropdown_wrap,
+            mo.hstack([state_select, postcode_select], justify="start"),
+            state_counts,
+        ]
+    )
     return (inputs,)
 
 
@@ -5,9 +5,21 @@ This module provides functions to automatically categorize organizations based o
 their names and classifications into predefined categories.
 """
 
-import polars as pl
+import multiprocessing
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from typing import Optional
 
+import polars as pl
+
+from facets import LOCATION_SCHEMA
+from profiling import enable_profiling, profiled, profiling_dir, profiling_to
+
+# Rows categorized and written per chunk when streaming; smaller chunks lower peak memory
+DEFAULT_CHUNK_SIZE = 50_000
+
 CATEGORIES = [
     "Religious Organizations",
     "Educational",
@@ -326,6 +338,24 @@ def categorize_organization(org_name: str, classification: Optional[str] = None)
     return "Others"
 
 
+def _category_expr(has_classification: bool) -> pl.Expr:
+    """Expression computing the category of each row, elementwise so it can run chunk by chunk."""
+    if has_classification:
+        return (
+            pl.struct(["organization", "classification"])
+            .map_elements(
+                lambda x: categorize_organization(x["organization"], x["classification"]), return_dtype=pl.Utf8
+            )
+            .alias("category")
+        )
+    return (
+        pl.col("organization")
+        .map_elements(lambda x: categorize_organization(x, None), return_dtype=pl.Utf8)
+        .alias("category")
+    )
+
+
+@profiled("add_category_column")
 def add_category_column(df: pl.DataFrame) -> pl.DataFrame:
     """
     Add category column to a DataFrame.
@@ -336,28 +366,7 @@ def add_category_column(df: pl.DataFrame) -> pl.DataFrame:
     Returns:
         DataFrame with 'category' column added
     """
-    has_classification = "classification" in df.columns
-
-    if has_classification:
-        df = df.with_columns(
-            [
-                pl.struct(["organization", "classification"])
-                .map_elements(
-                    lambda x: categorize_organization(x["organization"], x["classification"]), return_dtype=pl.Utf8
-                )
-                .alias("category")
-            ]
-        )
-    else:
-        df = df.with_columns(
-            [
-                pl.col("organization")
-                .map_elements(lambda x: categorize_organization(x, None), return_dtype=pl.Utf8)
-                .alias("category")
-            ]
-        )
-
-    return df
+    return df.with_columns(_category_expr("classification" in df.columns))
 
 
 def categorize_csv_file(csv_path: str, output_path: Optional[str] = None, verbose: bool = True) -> pl.DataFrame:
@@ -373,7 +382,7 @@ def categorize_csv_file(csv_path: str, output_path: Optional[str] = None, verbos
         DataFrame with category column added
     """
     # Read CSV
-    df = pl.read_csv(csv_path)
+    df = pl.read_csv(csv_path, schema_overrides=LOCATION_SCHEMA)
 
     # Verify required columns
     if "organization" not in df.columns:
@@ -395,16 +404,140 @@ def categorize_csv_file(csv_path: str, output_path: Optional[str] = None, verbos
     return df
 
 
-if __name__ == "__main__":
-    import sys
+@profiled("categorize_csv_file_streaming")
+def categorize_csv_file_streaming(
+    csv_path: str, output_path: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE, verbose: bool = True
+) -> str:
+    """
+    Categorize organizations in a CSV file without loading it into memory.
+
+    The input is scanned lazily, and each chunk of rows is categorized and appended to the
+    output before the next is read.
 
-    if len(sys.argv) < 2:
-        print("Usage: python categorize_organizations.py <csv_file> [output_file]")
-        print("  csv_file: Path to input CSV file")
-        print("  output_file: Optional path to output CSV file (default: overwrites input)")
-        sys.exit(1)
+    Args:
+        csv_path: Path to input CSV file
+        output_path: Path to output CSV file (if None, overwrites input)
+        chunk_size: Number of rows categorized and written per chunk
+        verbose: Whether to print summary information
+
+    Returns:
+        Path of the written CSV file
+    """
+    lf = pl.scan_csv(csv_path, schema_overrides=LOCATION_SCHEMA)
+    columns = lf.collect_schema().names()
 
-    csv_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+    # Verify required columns
+    if "organization" not in columns:
+        raise ValueError("CSV must contain 'organization' column")
+
+    # Write to a temporary file first, since the input may still be being read when the output is written
+    output = output_path if output_path else csv_path
+    tmp_output = f"{output}.tmp"
+    categorized = lf.with_columns(_category_expr("classification" in columns))
+    with open(tmp_output, "wb") as f:
+        # The header is written up front, so an input without rows still gets one
+        pl.DataFrame(schema=categorized.collect_schema()).write_csv(f)
+        for chunk in categorized.collect_batches(chunk_size=chunk_size):
+            chunk.write_csv(f, include_header=False)
+    os.replace(tmp_output, output)
+
+    if verbose:
+        print(f"Streamed {csv_path} in chunks of {chunk_size} rows")
+        print(f"Saved to {output}")
+
+    return output
+
+
+def _categorize_in_worker(
+    csv_path: str, output_path: Optional[str], chunk_size: int, verbose: bool, profile_dir: Optional[str]
+) -> str:
+    """Stream one file in a worker process, profiling it into profile_dir if given."""
+    if profile_dir is None:
+        return categorize_csv_file_streaming(csv_path, output_path, chunk_size, verbose)
+    with profiling_to(profile_dir):
+        return categorize_csv_file_streaming(csv_path, output_path, chunk_size, verbose)
+
+
+@profiled("categorize_csv_files")
+def categorize_csv_files(
+    csv_paths: list[str],
+    output_dir: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_workers: Optional[int] = None,
+    verbose: bool = True,
+) -> list[str]:
+    """
+    Stream several CSV files through the categorizer in parallel, one worker process per file.
+
+    Args:
+        csv_paths: Paths to input CSV files
+        output_dir: Directory for output files, keeping input file names (if None, overwrites inputs).
+            Inputs with the same file name would overwrite each other there, so they are rejected.
+        chunk_size: Number of rows categorized and written per chunk, per worker
+        max_workers: Maximum number of worker processes (defaults to the number of CPUs)
+        verbose: Whether to print summary information
+
+    Returns:
+        Paths of the written CSV files, in input order
+    """
+    output_paths = [str(Path(output_dir) / Path(path).name) if output_dir else None for path in csv_paths]
+    # Workers writing the same output (or its .tmp file) at once would silently overwrite each other
+    targets = Counter(Path(output_path or csv_path).resolve() for csv_path, output_path in zip(csv_paths, output_paths))
+    duplicates = sorted(str(target) for target, count in targets.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Several input files would be written to {', '.join(duplicates)}; rename them first")
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    # Each file is profiled in its worker, into a numbered subdirectory of this process's reports
+    parent_profile_dir = profiling_dir()
+    profile_dirs = [
+        str(Path(parent_profile_dir) / f"{i}_{Path(path).stem}") if parent_profile_dir else None
+        for i, path in enumerate(csv_paths)
+    ]
+
+    # Categorization runs Python code per row, so use processes rather than threads. Spawn instead of fork,
+    # as forking after polars has started its thread pool can deadlock.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        futures = [
+            executor.submit(_categorize_in_worker, csv_path, output_path, chunk_size, verbose, profile_dir)
+            for csv_path, output_path, profile_dir in zip(csv_paths, output_paths, profile_dirs)
+        ]
+        return [future.result() for future in futures]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Categorize organizations in donation data CSV files.")
+    parser.add_argument("csv_file", nargs="+", help="Path to input CSV file(s)")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream input files in chunks and process several files in parallel",
+    )
+    parser.add_argument(
+        "--output-dir", help="Output directory when streaming (default: overwrites inputs)", default=None
+    )
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per chunk when streaming")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes when streaming")
+    parser.add_argument("--profile", metavar="DIR", help="Write CPU and memory profiling reports to DIR")
+    args = parser.parse_args()
+
+    if args.profile:
+        enable_profiling(args.profile)
+
+    if args.stream:
+        try:
+            categorize_csv_files(args.csv_file, args.output_dir, args.chunk_size, args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        # python categorize_organizations.py <csv_file> [output_file]
+        if len(args.csv_file) > 2:
+            parser.error("pass --stream to categorize more than one file")
+        csv_path = args.csv_file[0]
+        output_path = args.csv_file[1] if len(args.csv_file) > 1 else None
 
-    categorize_csv_file(csv_path, output_path)
+        categorize_csv_file(csv_path, output_path)
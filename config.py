@@ -0,0 +1,19 @@
+"""
+Paths of the generated outputs, shared by the pipeline and the tools reading its outputs.
+
+Set GENERATED_BASE_PATH to write and read the outputs somewhere other than public/generated.
+"""
+
+import os
+
+GENERATED_BASE_PATH = os.environ.get("GENERATED_BASE_PATH", "./public/generated")
+GENERATED_11D_BASE_PATH = f"{GENERATED_BASE_PATH}/subsection_11D"
+GENERATED_446_BASE_PATH = f"{GENERATED_BASE_PATH}/subsection_44_6"
+GENERATED_PUA_BASE_PATH = f"{GENERATED_BASE_PATH}/subsection_PUA"
+
+# Merged output of each section, as written by the pipeline's merge_csv
+SECTION_FILES = {
+    "446": f"{GENERATED_446_BASE_PATH}/subsection_44_6.csv",
+    "11D": f"{GENERATED_11D_BASE_PATH}/subsection_11D.csv",
+    "PUA": f"{GENERATED_PUA_BASE_PATH}/subsection_pua.csv",
+}
@@ -0,0 +1,200 @@
+"""
+State and postcode extraction, and precomputed facet counts over the merged sections.
+
+Addresses are free text, so state and postcode are extracted once when the pipeline
+merges a section and stored as columns. Filtering and reporting then group on those
+columns instead of running a regex over every address. The facet index written to
+facets.csv holds the number of listings per section, facet and value.
+"""
+
+from pathlib import Path
+
+import polars as pl
+
+from config import GENERATED_BASE_PATH, SECTION_FILES
+from normalize import normalize_name_expr
+
+FACET_INDEX_PATH = f"{GENERATED_BASE_PATH}/facets.csv"
+FACETS = ["state", "postcode", "category", "status"]
+# Postcodes such as 06000 must be read as strings to keep their leading zero
+LOCATION_SCHEMA = {"state": pl.Utf8, "postcode": pl.Utf8}
+
+STATES = [
+    "JOHOR",
+    "KEDAH",
+    "KELANTAN",
+    "MELAKA",
+    "NEGERI SEMBILAN",
+    "PAHANG",
+    "PERAK",
+    "PERLIS",
+    "PULAU PINANG",
+    "SABAH",
+    "SARAWAK",
+    "SELANGOR",
+    "TERENGGANU",
+    "KUALA LUMPUR",
+    "PUTRAJAYA",
+    "LABUAN",
+]
+# Spellings found in addresses, after normalize_name, mapped to their state
+STATE_ALIASES = {state: state for state in STATES} | {
+    "MALACCA": "MELAKA",
+    "N SEMBILAN": "NEGERI SEMBILAN",
+    "PENANG": "PULAU PINANG",
+    "P PINANG": "PULAU PINANG",
+    "TRENGGANU": "TERENGGANU",
+}
+# First two digits of a postcode. Addresses name the wrong state more often than they carry a wrong
+# postcode, so the postcode wins; 68 spans Kuala Lumpur and Selangor and is left to the address text
+POSTCODE_PREFIX_STATES = (
+    {f"{prefix:02d}": "PERLIS" for prefix in range(1, 3)}
+    | {f"{prefix:02d}": "KEDAH" for prefix in range(5, 10)}
+    | {f"{prefix:02d}": "PULAU PINANG" for prefix in range(10, 15)}
+    | {f"{prefix:02d}": "KELANTAN" for prefix in range(15, 19)}
+    | {f"{prefix:02d}": "TERENGGANU" for prefix in range(20, 25)}
+    | {f"{prefix:02d}": "PAHANG" for prefix in [*range(25, 29), 39, 49, 69]}
+    | {f"{prefix:02d}": "PERAK" for prefix in range(30, 37)}
+    | {f"{prefix:02d}": "SELANGOR" for prefix in [*range(40, 49), 63, 64]}
+    | {f"{prefix:02d}": "KUALA LUMPUR" for prefix in range(50, 61)}
+    | {"62": "PUTRAJAYA"}
+    | {f"{prefix:02d}": "NEGERI SEMBILAN" for prefix in range(70, 74)}
+    | {f"{prefix:02d}": "MELAKA" for prefix in range(75, 79)}
+    | {f"{prefix:02d}": "JOHOR" for prefix in range(79, 87)}
+    | {"87": "LABUAN"}
+    | {f"{prefix:02d}": "SABAH" for prefix in range(88, 92)}
+    | {f"{prefix:02d}": "SARAWAK" for prefix in range(93, 99)}
+)
+
+# Longest alias first, so NEGERI SEMBILAN is not cut short by another alternative
+_STATE_PATTERN = r"\b(" + "|".join(sorted(STATE_ALIASES, key=len, reverse=True)) + r")\b"
+
+
+def postcode_expr(address: pl.Expr) -> pl.Expr:
+    """Postcode of an address: its last standalone five digit number that is not a P.O. box number."""
+    return (
+        normalize_name_expr(address)
+        .str.replace_all(r"\b(PETI SURAT|P O BOX|PO BOX|BOX) \d+", "")
+        .str.extract_all(r"\b\d{5}\b")
+        .list.last()
+    )
+
+
+def state_expr(address: pl.Expr, postcode: pl.Expr) -> pl.Expr:
+    """State of an address: the state its postcode belongs to, else the last state it names."""
+    named = normalize_name_expr(address).str.extract_all(_STATE_PATTERN).list.last()
+    return pl.coalesce(
+        postcode.str.slice(0, 2).replace_strict(POSTCODE_PREFIX_STATES, default=None),
+        named.replace_strict(STATE_ALIASES, default=None),
+    )
+
+
+def add_location_columns(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Add state and postcode columns extracted from the address column.
+
+    Args:
+        df: DataFrame or LazyFrame with an 'address' column
+
+    Returns:
+        The same frame with 'state' and 'postcode' columns added
+    """
+    return df.with_columns(postcode_expr(pl.col("address")).alias("postcode")).with_columns(
+        state_expr(pl.col("address"), pl.col("postcode")).alias("state")
+    )
+
+
+def _scan_sections(section_files: dict[str, str]) -> pl.LazyFrame:
+    frames = []
+    for section, path in section_files.items():
+        if not Path(path).exists():
+            continue
+        frame = pl.scan_csv(path, infer_schema=False)
+        columns = frame.collect_schema().names()
+        # Outputs merged before state and postcode were extracted get them on the fly
+        if "state" not in columns:
+            frame = add_location_columns(frame)
+        # A freshly merged output has no category until categorize_organizations.py runs
+        if "category" not in columns:
+            frame = frame.with_columns(pl.lit(None, pl.Utf8).alias("category"))
+        frames.append(frame.select(pl.lit(section).alias("section"), *FACETS))
+    return pl.concat(frames)
+
+
+def build_facet_index(
+    section_files: dict[str, str] = SECTION_FILES, output_path: str = FACET_INDEX_PATH
+) -> pl.DataFrame:
+    """
+    Count listings per section, facet and value, and save the counts.
+
+    Args:
+        section_files: Merged section CSVs to index, keyed by section
+        output_path: Path to write the facet index CSV to
+
+    Returns:
+        Facet index with section, facet, value and count columns
+    """
+    index = (
+        _scan_sections(section_files)
+        .unpivot(index="section", on=FACETS, variable_name="facet")
+        .group_by("section", "facet", "value")
+        .len("count")
+        .sort("section", "facet", "count", "value", descending=[False, False, True, False], nulls_last=True)
+        .collect()
+    )
+    index.write_csv(output_path)
+    return index
+
+
+def facet_counts(
+    by: list[str],
+    section: str | None = None,
+    status: str | None = "approved",
+    section_files: dict[str, str] = SECTION_FILES,
+) -> pl.DataFrame:
+    """
+    Count listings for every combination of the given facets, e.g. state by category.
+
+    Args:
+        by: Facets to group by, from FACETS
+        section: Only count listings of this section
+        status: Only count listings with this status (all statuses if None)
+        section_files: Merged section CSVs to count, keyed by section
+
+    Returns:
+        One row per combination of facet values with its count, largest first
+    """
+    unknown = set(by) - set(FACETS)
+    if unknown:
+        raise ValueError(f"Unknown facets {sorted(unknown)}, expected some of {FACETS}")
+
+    listings = _scan_sections(section_files)
+    if section is not None:
+        listings = listings.filter(pl.col("section") == section)
+    if status is not None:
+        listings = listings.filter(pl.col("status") == status)
+    return listings.group_by(by).len("count").sort(["count", *by], descending=[True] + [False] * len(by)).collect()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the facet index, or count listings by facets for reporting.")
+    parser.add_argument("--by", nargs="+", choices=FACETS, help="Facets to count by (default: rebuild the index)")
+    parser.add_argument("--section", choices=list(SECTION_FILES), default=None, help="Only count this section")
+    parser.add_argument("--status", default="approved", help="Only count this status, or 'all'")
+    parser.add_argument("--output", default=None, help="Path to write the counts CSV to")
+    args = parser.parse_args()
+
+    if args.by is None:
+        index = build_facet_index()
+        print(f"Indexed {index['count'].sum() // len(FACETS)} listings into {len(index)} facet values")
+        print(f"Saved to {FACET_INDEX_PATH}")
+    else:
+        counts = facet_counts(args.by, args.section, None if args.status == "all" else args.status)
+        if args.output:
+            counts.write_csv(args.output)
+            print(f"Saved to {args.output}")
+        else:
+            with pl.Config(tbl_rows=-1):
+                print(counts)
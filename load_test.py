@@ -0,0 +1,193 @@
+"""
+Load test the scraper against the local replay server.
+
+Runs pipeline.py's submit_jobs over the saved snapshots at several concurrency
+settings and reports pages/sec, p95 page latency and peak memory for each, so
+scraper changes can be tuned and checked for throughput regressions offline.
+"""
+
+import asyncio
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+from loguru import logger
+
+from replay_server import SNAPSHOTS_PATH, available_pages, search_form_page, start_server
+
+
+def process_tree_rss(pid: int) -> int:
+    """Resident bytes of a process and all its descendants (browsers included), read from /proc on Linux."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            status = Path(f"/proc/{current}/status").read_text()
+            if match := re.search(r"VmRSS:\s+(\d+) kB", status):
+                total += int(match.group(1)) * 1024
+            for task in Path(f"/proc/{current}/task").iterdir():
+                pending.extend(int(child) for child in (task / "children").read_text().split())
+        except OSError:
+            continue
+    return total
+
+
+class MemorySampler:
+    """Tracks the peak resident memory of this process tree on a background thread."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_tree_rss(os.getpid()))
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def page_jobs(pages: list[int], pages_per_job: int) -> list[tuple[int, int]]:
+    """Split pages into contiguous (page_start, page_end) ranges, as submit_jobs expects."""
+    return [(pages[i], pages[min(i + pages_per_job, len(pages)) - 1]) for i in range(0, len(pages), pages_per_job)]
+
+
+def run_load_test(
+    section: str,
+    pages: list[int],
+    concurrency_levels: list[int],
+    pages_per_job: int = 10,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    snapshots_path: str = SNAPSHOTS_PATH,
+    table_only: bool = False,
+) -> pl.DataFrame:
+    """
+    Scrape pages from the replay server once per concurrency level.
+
+    Args:
+        section: Section to scrape ("446", "11D" or "PUA")
+        pages: Page numbers to scrape
+        concurrency_levels: Values of submit_jobs' concurrent argument to test
+        pages_per_job: Pages scraped sequentially by each job (one browser per job)
+        latency: Seconds the server adds to every page response
+        jitter: Maximum extra random seconds the server adds on top of latency
+        error_rate: Probability (0-1) that the server fails a page request
+        snapshots_path: Directory containing the saved snapshot pages
+        table_only: Extract and parse only the results table of each page
+
+    Returns:
+        DataFrame with one row of throughput, latency and memory results per concurrency level
+
+    Raises:
+        FileNotFoundError: No snapshot has the section's search form
+    """
+    # Without the section's search form every job would fail to authenticate and scrape nothing
+    search_form_page(section, snapshots_path)
+    server = start_server(port=0, snapshots_path=snapshots_path, latency=latency, jitter=jitter, error_rate=error_rate)
+    output_dir = tempfile.TemporaryDirectory()
+    for subsection in ["subsection_44_6", "subsection_11D", "subsection_PUA"]:
+        Path(output_dir.name, subsection).mkdir()
+
+    # pipeline.py reads these when its setup cell runs, so they must be set before importing it
+    os.environ["HASIL_BASE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ["GENERATED_BASE_PATH"] = output_dir.name
+    from pipeline import app
+
+    _, defs = app.run()
+    submit_jobs = defs["submit_jobs"]
+
+    latencies: list[float] = []
+    errors = 0
+
+    def record(message):
+        nonlocal errors
+        if "elapsed" in message.record["extra"]:
+            latencies.append(message.record["extra"]["elapsed"])
+        elif message.record["level"].name == "ERROR":
+            errors += 1
+
+    # Replace the pipeline's stderr logging, which would dump whole pages on injected errors
+    logger.remove()
+    logger.add(record, level="INFO")
+
+    results = []
+    try:
+        for concurrency in concurrency_levels:
+            latencies.clear()
+            errors = 0
+            with MemorySampler() as sampler:
+                started = time.perf_counter()
+                jobs = page_jobs(pages, pages_per_job)
+                asyncio.run(submit_jobs(section, jobs, concurrency, save_snapshot=False, table_only=table_only))
+                wall = time.perf_counter() - started
+
+            page_latencies = pl.Series(latencies, dtype=pl.Float64)
+            results.append(
+                {
+                    "concurrency": concurrency,
+                    "pages": len(latencies),
+                    "errors": errors,
+                    "seconds": round(wall, 2),
+                    "pages_per_sec": round(len(latencies) / wall, 2),
+                    "p50_latency": page_latencies.quantile(0.5),
+                    "p95_latency": page_latencies.quantile(0.95),
+                    "peak_rss_mb": round(sampler.peak / 1024**2, 1),
+                }
+            )
+    finally:
+        server.shutdown()
+        output_dir.cleanup()
+
+    return pl.DataFrame(results)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load test the scraper against the local replay server.")
+    parser.add_argument("--section", choices=["446", "11D", "PUA"], default="446")
+    parser.add_argument("--pages", type=int, nargs=2, metavar=("START", "END"), help="Page range (default: all)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8], help="Concurrency levels")
+    parser.add_argument("--pages-per-job", type=int, default=10, help="Pages scraped per browser")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the server adds to every page")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum random seconds added on top of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability a page request fails")
+    parser.add_argument("--snapshots", default=SNAPSHOTS_PATH, help="Directory of saved snapshot pages")
+    parser.add_argument("--table-only", action="store_true", help="Extract only the results table in the browser")
+    parser.add_argument("--output", help="Optional CSV path to save the results to")
+    args = parser.parse_args()
+
+    pages = available_pages(args.section, args.snapshots)
+    if args.pages:
+        pages = [page for page in pages if args.pages[0] <= page <= args.pages[1]]
+
+    results = run_load_test(
+        args.section,
+        pages,
+        args.concurrency,
+        args.pages_per_job,
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.snapshots,
+        args.table_only,
+    )
+    with pl.Config(tbl_rows=-1, tbl_cols=-1):
+        print(results)
+    if args.output:
+        results.write_csv(args.output)
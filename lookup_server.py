@@ -0,0 +1,277 @@
+"""
+Local HTTP lookup service over the merged section outputs.
+
+Loads the merged 44(6), 44(11D) and P.U.(A) CSVs once, indexes them by reference
+number and normalized name, and answers single and batch lookups from memory. The
+CSVs are polled and the indexes rebuilt when a new pipeline output lands.
+
+Endpoints:
+    GET  /lookup?reference_num=8102&section=446&date=2026-01-31
+    GET  /lookup?name=Persatuan Hospis Tawau
+    GET  /lookup?reference_num=2&name=Hospis Melaka
+    POST /lookup/batch  {"items": [{"reference_num": "8102"}, {"name": "..."}, ...]}
+    GET  /health
+"""
+
+import json
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import polars as pl
+
+from config import SECTION_FILES
+from normalize import normalize_name, normalize_name_expr
+
+RECORD_COLUMNS = ["section", "reference_num", "organization", "address", "start_date", "end_date", "status", "category"]
+RELOAD_INTERVAL = 5.0
+
+
+@dataclass(frozen=True)
+class LookupIndex:
+    """Immutable snapshot of the loaded sections, swapped whole on reload so readers never need a lock."""
+
+    records: list[dict]
+    name_keys: list[str]
+    by_reference: dict[str, list[int]]
+    by_name: dict[str, list[int]]
+    mtimes: dict[str, float]
+    loaded_at: float
+
+    @classmethod
+    def load(cls, section_files: dict[str, str]) -> "LookupIndex":
+        frames = []
+        mtimes = {}
+        for section, path in section_files.items():
+            if not Path(path).exists():
+                continue
+            mtimes[path] = Path(path).stat().st_mtime
+            df = pl.read_csv(path, infer_schema=False)
+            df = df.with_columns(pl.lit(section).alias("section"))
+            frames.append(
+                df.select(
+                    [pl.col(col) if col in df.columns else pl.lit(None, pl.Utf8).alias(col) for col in RECORD_COLUMNS]
+                )
+            )
+
+        df = pl.concat(frames) if frames else pl.DataFrame(schema={col: pl.Utf8 for col in RECORD_COLUMNS})
+        df = df.with_row_index("row").with_columns(normalize_name_expr(pl.col("organization")).alias("name_key"))
+
+        def _index(key: str) -> dict[str, list[int]]:
+            grouped = df.group_by(key).agg(pl.col("row"))
+            return dict(zip(grouped[key].to_list(), grouped["row"].to_list()))
+
+        return cls(
+            records=df.select(RECORD_COLUMNS).to_dicts(),
+            name_keys=df["name_key"].to_list(),
+            by_reference=_index("reference_num"),
+            by_name=_index("name_key"),
+            mtimes=mtimes,
+            loaded_at=time.time(),
+        )
+
+    def lookup(
+        self,
+        reference_num: str | None = None,
+        name: str | None = None,
+        section: str | None = None,
+        on_date: date | None = None,
+    ) -> dict:
+        """
+        Find records by reference number, falling back to normalized name.
+
+        Reference numbers are not unique, as one can be listed for several organizations, so a
+        name given alongside a reference number narrows its matches to that organization. If
+        none of them has the name, all are returned and the lookup is flagged as a name mismatch.
+
+        Args:
+            reference_num: Approval reference number
+            name: Organization name, matched after normalization
+            section: Optional section ("446", "11D" or "PUA") to restrict matches to
+            on_date: Date the approval must cover (defaults to today)
+
+        Returns:
+            Dict with the matching records, each marked with whether it is approved on on_date,
+            and with:
+            - approved: whether the matches are a single organization that is approved on on_date
+            - ambiguous: the matches are more than one organization
+            - name_mismatch: the reference number matched, but none of its organizations has the name
+        """
+        name_key = normalize_name(name) if name else None
+        rows: list[int] = []
+        name_mismatch = False
+        if reference_num:
+            rows = self.by_reference.get(str(reference_num).strip(), [])
+            if rows and name_key:
+                named = [row for row in rows if self.name_keys[row] == name_key]
+                name_mismatch = not named
+                rows = named or rows
+        if not rows and name_key:
+            rows = self.by_name.get(name_key, [])
+        if section:
+            rows = [row for row in rows if self.records[row]["section"] == section]
+
+        # Records hold ISO dates, which compare correctly as strings
+        day = (on_date or date.today()).isoformat()
+
+        def _approved(record: dict) -> bool:
+            return record["status"] == "approved" and record["start_date"] <= day <= record["end_date"]
+
+        matches = [{**self.records[row], "approved": _approved(self.records[row])} for row in rows]
+        ambiguous = len({self.name_keys[row] for row in rows}) > 1
+        approved = not ambiguous and not name_mismatch and any(match["approved"] for match in matches)
+        return {"approved": approved, "ambiguous": ambiguous, "name_mismatch": name_mismatch, "matches": matches}
+
+
+def lookup_args(item: dict) -> dict:
+    """
+    Validate one lookup's query parameters or batch item into keyword arguments for LookupIndex.lookup.
+
+    Args:
+        item: Dict with reference_num and/or name, and optionally section and date (ISO format)
+
+    Returns:
+        Keyword arguments for LookupIndex.lookup
+
+    Raises:
+        ValueError: A value has the wrong type, the section or date is invalid, or neither
+            reference_num nor name is given
+    """
+    reference_num, name, section, on_date = (item.get(key) for key in ["reference_num", "name", "section", "date"])
+    # Reference numbers are numeric, so JSON clients may send them as numbers
+    if isinstance(reference_num, int) and not isinstance(reference_num, bool):
+        reference_num = str(reference_num)
+    for key, value in [("reference_num", reference_num), ("name", name), ("section", section), ("date", on_date)]:
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{key} must be a string")
+    if not reference_num and not name:
+        raise ValueError("reference_num or name is required")
+    if section and section not in SECTION_FILES:
+        raise ValueError(f"section must be one of {', '.join(SECTION_FILES)}")
+    try:
+        on_date = date.fromisoformat(on_date) if on_date else None
+    except ValueError:
+        raise ValueError(f"date must be an ISO date such as 2026-01-31, got {on_date!r}") from None
+    return {"reference_num": reference_num, "name": name, "section": section, "on_date": on_date}
+
+
+class LookupService:
+    """Holds the current LookupIndex and reloads it when the section CSVs change."""
+
+    def __init__(self, section_files: dict[str, str] = SECTION_FILES, reload_interval: float = RELOAD_INTERVAL):
+        self.section_files = section_files
+        self.reload_interval = reload_interval
+        self.index = LookupIndex.load(section_files)
+        self._stop = threading.Event()
+
+    def _current_mtimes(self) -> dict[str, float]:
+        return {path: Path(path).stat().st_mtime for path in self.section_files.values() if Path(path).exists()}
+
+    def reload_if_changed(self) -> bool:
+        """Rebuild the index if any section CSV was added, removed or modified. Returns whether it reloaded."""
+        if self._current_mtimes() == self.index.mtimes:
+            return False
+        self.index = LookupIndex.load(self.section_files)
+        return True
+
+    def watch(self):
+        """Poll the section CSVs for changes on a background thread."""
+
+        def _run():
+            while not self._stop.wait(self.reload_interval):
+                try:
+                    if self.reload_if_changed():
+                        print(f"Reloaded {len(self.index.records)} records")
+                except (OSError, pl.exceptions.PolarsError) as e:
+                    # A CSV caught mid-write fails to parse; keep serving the old index and retry
+                    print(f"Reload failed, keeping previous index: {e}")
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+
+def make_handler(service: LookupService) -> type[BaseHTTPRequestHandler]:
+    """Build a request handler answering lookups from service's current index."""
+
+    class LookupHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            if url.path == "/health":
+                index = service.index
+                self._send_json(
+                    {"records": len(index.records), "files": list(index.mtimes), "loaded_at": index.loaded_at}
+                )
+            elif url.path == "/lookup":
+                try:
+                    args = lookup_args(params)
+                except ValueError as e:
+                    self.send_error(400, str(e))
+                    return
+                self._send_json(service.index.lookup(**args))
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/lookup/batch":
+                self.send_error(404)
+                return
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                items = [dict(item) for item in body["items"]]
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400, 'Body must be JSON of the form {"items": [...]}')
+                return
+            args = []
+            for position, item in enumerate(items):
+                try:
+                    args.append(lookup_args(item))
+                except ValueError as e:
+                    self.send_error(400, f"Invalid item {position}: {e}")
+                    return
+
+            # Look up every item against the same index, even if a reload happens midway
+            index = service.index
+            results = [index.lookup(**item_args) for item_args in args]
+            self._send_json({"results": results})
+
+        def _send_json(self, payload: dict):
+            content = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return LookupHandler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve approved organization lookups from the merged section CSVs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--reload-interval", type=float, default=RELOAD_INTERVAL, help="Seconds between checks for new outputs"
+    )
+    args = parser.parse_args()
+
+    service = LookupService(reload_interval=args.reload_interval)
+    service.watch()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Loaded {len(service.index.records)} records, serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        service.stop()
+        server.shutdown()
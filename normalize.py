@@ -0,0 +1,69 @@
+"""
+Organization name normalization shared by the lookup service and batch jobs.
+
+normalize_name and normalize_name_expr must agree, so that names normalized row by row
+match names normalized in a polars query. The same goes for canonical_name and
+canonical_name_expr, which also expand common abbreviations for entity matching.
+"""
+
+import re
+
+import polars as pl
+
+_NON_ALNUM = r"[^0-9A-Z]+"
+
+# Applied in order to normalized names, so SJK(C) has already become "SJK C"
+ABBREVIATIONS = [
+    (r"\bSJK ?C\b", "SEKOLAH JENIS KEBANGSAAN CINA"),
+    (r"\bSJK ?T\b", "SEKOLAH JENIS KEBANGSAAN TAMIL"),
+    (r"\bSJK\b", "SEKOLAH JENIS KEBANGSAAN"),
+    (r"\bSMJK\b", "SEKOLAH MENENGAH JENIS KEBANGSAAN"),
+    (r"\bSMK\b", "SEKOLAH MENENGAH KEBANGSAAN"),
+    (r"\bSK\b", "SEKOLAH KEBANGSAAN"),
+    (r"\bTPRI\b", "TABUNG PENGURUSAN RUMAH IBADAT"),
+    (r"\bTPBRI\b", "TABUNG PEMBINAAN RUMAH IBADAT"),
+    (r"\bTPBS\b", "TABUNG PEMBINAAN SEKOLAH"),
+    (r"\bPERS\b", "PERSATUAN"),
+    (r"\bPERTUB\b", "PERTUBUHAN"),
+    (r"\bASSN\b", "ASSOCIATION"),
+    (r"\bFDN\b", "FOUNDATION"),
+    (r"\bMSIA\b", "MALAYSIA"),
+    (r"\bKL\b", "KUALA LUMPUR"),
+    (r"\bWP\b", "WILAYAH PERSEKUTUAN"),
+    # Company suffixes carry no identity
+    (r"\b(BERHAD|BHD|SDN)\b", ""),
+]
+# "TABUNG PENGURUSAN RUMAH IBADAT (TPRI)" spells the abbreviation out already, so the
+# expansion is matched along with it rather than repeated
+_ABBREVIATION_PATTERNS = [
+    (rf"\b(?:{replacement} )?" + pattern.removeprefix(r"\b") if replacement else pattern, replacement)
+    for pattern, replacement in ABBREVIATIONS
+]
+
+
+def normalize_name(name: str | None) -> str:
+    """Uppercase a name and collapse punctuation and whitespace runs into single spaces."""
+    if not name:
+        return ""
+    return re.sub(_NON_ALNUM, " ", name.upper()).strip()
+
+
+def normalize_name_expr(expr: pl.Expr) -> pl.Expr:
+    """Vectorized normalize_name over a string column."""
+    return expr.fill_null("").str.to_uppercase().str.replace_all(_NON_ALNUM, " ").str.strip_chars()
+
+
+def canonical_name(name: str | None) -> str:
+    """Normalize a name and expand common Malay/English abbreviations, e.g. SJK(C) and TPRI."""
+    name = normalize_name(name)
+    for pattern, replacement in _ABBREVIATION_PATTERNS:
+        name = re.sub(pattern, replacement, name)
+    return re.sub(r" +", " ", name).strip()
+
+
+def canonical_name_expr(expr: pl.Expr) -> pl.Expr:
+    """Vectorized canonical_name over a string column."""
+    expr = normalize_name_expr(expr)
+    for pattern, replacement in _ABBREVIATION_PATTERNS:
+        expr = expr.str.replace_all(pattern, replacement)
+    return expr.str.replace_all(r" +", " ").str.strip_chars()
@@ -8,25 +8,43 @@ with app.setup:
     from datetime import date, datetime
     from dataclasses import dataclass
     import re
-    from typing import Literal
+    from typing import Callable, Literal
     from bs4 import BeautifulSoup
     from loguru import logger
-    from playwright.async_api import async_playwright, Page
+    from playwright.async_api import async_playwright, Page, Route
     from pathlib import Path
     import polars as pl
     import asyncio
+    from profiling import profiled
+    from config import GENERATED_11D_BASE_PATH, GENERATED_446_BASE_PATH, GENERATED_PUA_BASE_PATH
+    from entities import build_entity_index
+    from facets import LOCATION_SCHEMA, add_location_columns, build_facet_index
+    import os
+    import time
+    from urllib.parse import urlparse
+
+    # Point HASIL_BASE_URL at replay_server.py to scrape the saved snapshots offline
+    HASIL_BASE_URL = os.environ.get("HASIL_BASE_URL", "https://www.hasil.gov.my")
+    URL_446 = f"{HASIL_BASE_URL}/en/quick-links/services/donation-approval/subsection-44-6-of-the-income-tax-act-1967/"  # 124 pages
+    URL_11D = (
+        f"{HASIL_BASE_URL}/en/quick-links/services/donation-approval/subsection-44-11d-of-the-income-tax-act-1967/"
+    )
+    URL_PUA = f"{HASIL_BASE_URL}/en/quick-links/services/donation-approval/pu-a-1392020/"
 
-    URL_446 = "https://www.hasil.gov.my/en/quick-links/services/donation-approval/subsection-44-6-of-the-income-tax-act-1967/"  # 124 pages
-    URL_11D = "https://www.hasil.gov.my/en/quick-links/services/donation-approval/subsection-44-11d-of-the-income-tax-act-1967/"
-    URL_PUA = "https://www.hasil.gov.my/en/quick-links/services/donation-approval/pu-a-1392020/"
-
-    GENERATED_11D_BASE_PATH = "./public/generated/subsection_11D"
-    GENERATED_446_BASE_PATH = "./public/generated/subsection_44_6"
-    GENERATED_PUA_BASE_PATH = "./public/generated/subsection_PUA"
     DEFAULT_TIMEOUT = 60 * 60
 
     Section = Literal["446", "11D", "PUA"]
 
+    # Runs in the browser and returns only the results table, about a seventh of the page
+    RESULTS_TABLE_JS = """() => {
+        const th = [...document.querySelectorAll("th")].find((el) => el.textContent.trim() === "APPROVAL REFERENCE NO.");
+        return th ? th.closest("table").outerHTML : null;
+    }"""
+
+    # Rows are keyed on reference number and approval period when diffing runs
+    CHANGE_KEY = ["reference_num", "start_date", "end_date"]
+    CHANGE_FIELDS = ["organization", "address", "category", "status"]
+
 
 @app.cell
 def _():
@@ -52,11 +70,22 @@ def _(process_html, save_org_csv):
     async def scrape_subsection(
         *,
         section: Section,
-        page_start: int,
-        page_end: int,
+        page_start: int | None = None,
+        page_end: int | None = None,
+        pages: list[int] | None = None,
         save_snapshot: bool = False,
+        table_only: bool = False,
+        on_page_scraped: Callable[[int, str], None] | None = None,
     ) -> list[str]:
-        """Scrape a specific subsection page from page_start to page_end (inclusive). Returns list of save paths"""
+        """Scrape a specific subsection page from page_start to page_end (inclusive). Returns list of save paths
+
+        Args:
+            pages: Explicit page numbers to scrape instead of page_start to page_end
+            table_only: Extract only the results table in the browser, and snapshot and parse just that
+            on_page_scraped: Called with the page number and save path as soon as each page is saved
+        """
+        page_numbers = pages if pages is not None else list(range(page_start, page_end + 1))
+        page_start, page_end = min(page_numbers), max(page_numbers)
 
         if section == "446":
             goto_url = URL_446
@@ -74,6 +103,9 @@ def _(process_html, save_org_csv):
             async with async_playwright() as p:
                 browser = await p.chromium.launch()
                 page = await browser.new_page()
+                if "HASIL_BASE_URL" in os.environ:
+                    # Snapshots still load analytics and fonts, which networkidle would otherwise wait on
+                    await page.route("**/*", block_external_requests)
 
                 logger.info(f"Starting subsection {subsection_name} scrape from page {page_start} to page {page_end}")
                 await page.goto(goto_url)
@@ -85,19 +117,24 @@ def _(process_html, save_org_csv):
                     return []
 
                 save_paths: list[str] = []
-                for page_number in range(page_start, page_end + 1):
+                for page_number in page_numbers:
                     url = f"{goto_url}?page={page_number}"
                     logger.info(f"Scraping page {page_number}")
+                    started = time.perf_counter()
                     try:
                         await page.goto(url)
                         await page.wait_for_load_state("networkidle")
-                        content = await page.content()
+                        content = await page.evaluate(RESULTS_TABLE_JS) if table_only else await page.content()
                     except Exception as e:
                         logger.error(f"Error scraping page {page_number}: {e}")
                         continue
 
+                    if content is None:
+                        logger.error(f"Results table not found on page {page_number}")
+                        continue
+
                     if save_snapshot:
-                        save_page_html(content, page_number, section)
+                        save_page_html(content, page_number, section, table_only)
 
                     try:
                         orgs = process_html(content)
@@ -107,6 +144,10 @@ def _(process_html, save_org_csv):
 
                     path = save_org_csv(section, orgs, page_number)
                     save_paths.append(path)
+                    if on_page_scraped is not None:
+                        on_page_scraped(page_number, path)
+                    elapsed = time.perf_counter() - started
+                    logger.bind(page=page_number, elapsed=elapsed).info(f"Scraped page {page_number} in {elapsed:.2f}s")
 
                 logger.info("Succesfully scraped")
                 return save_paths
@@ -116,6 +157,15 @@ def _(process_html, save_org_csv):
     return (scrape_subsection,)
 
 
+@app.function
+async def block_external_requests(route: Route):
+    """Abort requests to any host but HASIL_BASE_URL, so a replayed scrape does not depend on the internet."""
+    if urlparse(route.request.url).netloc == urlparse(HASIL_BASE_URL).netloc:
+        await route.continue_()
+    else:
+        await route.abort()
+
+
 @app.function
 async def authenticate_page(page: Page, section: Section):
     # PUA page does not have this selector
@@ -133,8 +183,10 @@ async def authenticate_page(page: Page, section: Section):
 
 
 @app.function
-def save_page_html(content: str, page_num: int, section: Section):
-    with open(f"./snapshots/subsection_{section}_page{page_num}.html", "w") as f:
+def save_page_html(content: str, page_num: int, section: Section, table_only: bool = False):
+    # Table fragments are kept apart from full pages, which replay_server.py needs for the search form
+    suffix = "_table" if table_only else ""
+    with open(f"./snapshots/subsection_{section}_page{page_num}{suffix}.html", "w") as f:
         f.write(content)
 
 
@@ -158,17 +210,92 @@ def _():
 
 
 @app.function
+@profiled("merge_orgs")
 def merge_orgs(file_paths: list[str], save_path: str):
     if len(file_paths) == 0:
         raise ValueError("No file paths provided")
-    df = pl.scan_csv(file_paths).collect()
+    # The scraped category is kept as classification, leaving category to categorize_organizations.py.
+    # State and postcode are extracted here once, so filters and reports never parse addresses.
+    df = pl.scan_csv(file_paths).rename({"category": "classification"}).pipe(add_location_columns).collect()
     df.write_csv(save_path)
 
     logger.info(f"Saved file to {save_path}")
 
 
+@app.function
+def with_raw_category(df: pl.DataFrame) -> pl.DataFrame:
+    # merge_orgs keeps the scraped category as classification, and categorize_organizations.py adds its own
+    # category. Outputs merged before that hold the scraped category in category.
+    if "classification" not in df.columns:
+        return df
+    return df.drop("category", strict=False).rename({"classification": "category"})
+
+
+@app.function
+def diff_orgs(previous: pl.DataFrame, current: pl.DataFrame) -> pl.DataFrame:
+    """Keyed delta between two merged outputs of a section, hash joined on reference number and approval period.
+
+    Each returned row has a change_type of added, removed, approved, revoked, expired or updated,
+    and changed_fields lists the columns that differ between the two runs. The derived category is
+    ignored, and category is compared as the raw category scraped from the site.
+    """
+    previous, current = with_raw_category(previous), with_raw_category(current)
+    fields = [col for col in CHANGE_FIELDS if col in previous.columns and col in current.columns]
+    # reference numbers are not unique within a period (e.g. 11D), so number duplicates to keep the join 1:1
+    keys = [*CHANGE_KEY, "_dup"]
+
+    def _keyed(df: pl.DataFrame, marker: str) -> pl.DataFrame:
+        return (
+            df.select([*CHANGE_KEY, *fields])
+            .with_columns(pl.col(CHANGE_KEY).cast(pl.Utf8))
+            .sort([*CHANGE_KEY, "organization"])
+            .with_columns(pl.int_range(pl.len()).over(CHANGE_KEY).alias("_dup"), pl.lit(True).alias(marker))
+        )
+
+    joined = _keyed(previous, "_in_previous").join(
+        _keyed(current, "_in_current"), on=keys, how="full", coalesce=True, suffix="_new"
+    )
+
+    in_both = pl.col("_in_previous").is_not_null() & pl.col("_in_current").is_not_null()
+    changed_fields = (
+        pl.concat_list([pl.when(in_both & pl.col(f).ne_missing(pl.col(f"{f}_new"))).then(pl.lit(f)) for f in fields])
+        .list.drop_nulls()
+        .list.join(",")
+    )
+    status_changed = pl.col("status").ne_missing(pl.col("status_new"))
+    change_type = (
+        pl.when(pl.col("_in_previous").is_null())
+        .then(pl.lit("added"))
+        .when(pl.col("_in_current").is_null())
+        .then(pl.lit("removed"))
+        .when(status_changed & (pl.col("status_new") == "approved"))
+        .then(pl.lit("approved"))
+        .when(status_changed & (pl.col("status_new") == "revoked"))
+        .then(pl.lit("revoked"))
+        # Organization maps TAMAT TEMPOH KELULUSAN to "rejected"
+        .when(status_changed & pl.col("status_new").is_in(["expired", "rejected"]))
+        .then(pl.lit("expired"))
+        .when(changed_fields != "")
+        .then(pl.lit("updated"))
+    )
+
+    return (
+        joined.with_columns(change_type.alias("change_type"), changed_fields.alias("changed_fields"))
+        .filter(pl.col("change_type").is_not_null())
+        .select(
+            *CHANGE_KEY,
+            pl.coalesce("organization_new", "organization").alias("organization"),
+            pl.coalesce("status_new", "status").alias("status"),
+            "change_type",
+            "changed_fields",
+        )
+        .sort(["change_type", "reference_num"])
+    )
+
+
 @app.cell
 def _():
+    @profiled("process_html")
     def process_html(html: str) -> list[Organization]:
         soup = BeautifulSoup(html, "html.parser")
 
@@ -230,6 +357,7 @@ class Organization:
     status: Literal["approved", "expired", "revoked"]
     remarks: str | None
 
+    @profiled("Organization.__init__", allocations=False)
     def __init__(
         self,
         reference_num: str,
@@ -279,27 +407,53 @@ def merge_csv(section: Section) -> pl.DataFrame:
     if section == "446":
         path = GENERATED_446_BASE_PATH
         savepath = "subsection_44_6.csv"
+        changes_savepath = "subsection_44_6_changes.csv"
     elif section == "11D":
         path = GENERATED_11D_BASE_PATH
         savepath = "subsection_11D.csv"
+        changes_savepath = "subsection_11D_changes.csv"
     else:
         path = GENERATED_PUA_BASE_PATH
         savepath = "subsection_pua.csv"
+        changes_savepath = "subsection_pua_changes.csv"
 
     csv_paths = list(Path(path).glob("thread_*.csv"))
     final_path = f"{path}/{savepath}"
+    previous = pl.read_csv(final_path, schema_overrides=LOCATION_SCHEMA) if Path(final_path).exists() else None
     merge_orgs(csv_paths, final_path)
-    return pl.read_csv(final_path)
+    current = pl.read_csv(final_path, schema_overrides=LOCATION_SCHEMA)
+
+    if previous is not None:
+        changes = diff_orgs(previous, current)
+        changes.write_csv(f"{path}/{changes_savepath}")
+        logger.info(f"Wrote {len(changes)} changes to {path}/{changes_savepath}")
+
+    # Entity IDs span every section, so the index is rebuilt after each section's merge
+    entities = build_entity_index()
+    logger.info(f"Indexed {len(entities)} listings into {entities['entity_id'].n_unique()} entities")
+    facets = build_facet_index()
+    logger.info(f"Indexed {len(facets)} facet values")
+
+    return current
 
 
 @app.cell
 def _(scrape_subsection):
-    async def submit_jobs(pages: list[tuple[int, int]], concurrent: int) -> list[str]:
+    async def submit_jobs(
+        section: Section,
+        pages: list[tuple[int, int]],
+        concurrent: int,
+        save_snapshot: bool = True,
+        table_only: bool = False,
+    ) -> list[list[str]]:
         """Submit jobs to the executor
 
         Args:
+            section: Subsection to scrape
             pages: List of tuples of page start and page end
             concurrent: Max number of concurrent requests
+            save_snapshot: Whether to save each page's html to snapshots/
+            table_only: Extract, save and parse only the results table of each page
         """
         logger.info(f"Beginning scrape with {concurrent} max requests")
         semaphore = asyncio.Semaphore(concurrent)
@@ -307,16 +461,18 @@ def _(scrape_subsection):
         async def scrape_with_limit(page_start: int, page_end: int):
             async with semaphore:
                 return await scrape_subsection(
+                    section=section,
                     page_start=page_start,
                     page_end=page_end,
-                    save_snapshot=True,
+                    save_snapshot=save_snapshot,
+                    table_only=table_only,
                 )
 
         tasks = [scrape_with_limit(pg_start, pg_end) for pg_start, pg_end in pages]
         results = await asyncio.gather(*tasks)
         return results
 
-    return
+    return (submit_jobs,)
 
 
 @app.function
@@ -0,0 +1,264 @@
+"""
+Opt-in CPU and memory profiling for the parse and categorize stages.
+
+Set DONATIONS_PROFILE_DIR (or call enable_profiling) to profile every call of a function
+wrapped with @profiled. Reports are written to that directory when the process exits:
+
+- <stage>.folded: sampled stacks in collapsed format, for flamegraph.pl, inferno or speedscope
+- stages.csv: calls, time and peak traced memory per stage
+- calls.csv: time and peak traced memory of every call (process_html is called once per page)
+- allocations.csv: lines allocating the most memory within each stage
+
+Worker processes exit without running atexit handlers, so they profile with profiling_to
+instead. When profiling is off a wrapped call costs one extra check.
+"""
+
+import atexit
+import functools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+import polars as pl
+
+PROFILE_DIR_ENV = "DONATIONS_PROFILE_DIR"
+SAMPLE_INTERVAL = 0.001
+TOP_ALLOCATORS = 25
+
+
+@dataclass
+class _StageCall:
+    stage: str
+    started: float
+    start_memory: int
+    snapshot: tracemalloc.Snapshot | None
+    # Highest traced memory seen by nested stages, which reset the tracemalloc peak
+    peak_seen: int = 0
+
+
+class _Profiler:
+    def __init__(self, output_dir: str):
+        self.output_dir = Path(output_dir)
+        self.lock = threading.Lock()
+        self.active: dict[int, list[_StageCall]] = defaultdict(list)
+        self.calls: list[dict] = []
+        self.call_counts: Counter[str] = Counter()
+        self.stacks: dict[str, Counter[str]] = defaultdict(Counter)
+        self.allocations: dict[str, Counter[str]] = defaultdict(Counter)
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        tracemalloc.start()
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+        tracemalloc.stop()
+
+    def _sample(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self.lock:
+                active = {
+                    thread_id: {call.stage for call in stack} for thread_id, stack in self.active.items() if stack
+                }
+
+            for thread_id, stages in active.items():
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{code.co_qualname} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                folded = ";".join(reversed(names))
+                with self.lock:
+                    for stage in stages:
+                        self.stacks[stage][folded] += 1
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        )
+
+    def enter(self, stage: str, allocations: bool) -> _StageCall:
+        snapshot = self._snapshot() if allocations else None
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            stack = self.active[threading.get_ident()]
+            if stack:
+                stack[-1].peak_seen = max(stack[-1].peak_seen, peak)
+            call = _StageCall(stage, time.perf_counter(), current, snapshot)
+            stack.append(call)
+        tracemalloc.reset_peak()
+        return call
+
+    def exit(self, call: _StageCall):
+        elapsed = time.perf_counter() - call.started
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, call.peak_seen)
+
+        if call.snapshot is not None:
+            for stat in self._snapshot().compare_to(call.snapshot, "lineno"):
+                if stat.size_diff > 0:
+                    self.allocations[call.stage][str(stat.traceback[0])] += stat.size_diff
+
+        with self.lock:
+            stack = self.active[threading.get_ident()]
+            stack.pop()
+            if stack:
+                stack[-1].peak_seen = max(stack[-1].peak_seen, peak)
+            self.call_counts[call.stage] += 1
+            self.calls.append(
+                {
+                    "stage": call.stage,
+                    "call": self.call_counts[call.stage],
+                    "seconds": elapsed,
+                    "peak_bytes": peak - call.start_memory,
+                    "retained_bytes": current - call.start_memory,
+                }
+            )
+
+    def write_reports(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            for stage, stacks in self.stacks.items():
+                lines = "".join(f"{stack} {count}\n" for stack, count in stacks.items())
+                (self.output_dir / f"{stage}.folded").write_text(lines)
+
+            calls = pl.DataFrame(
+                self.calls,
+                schema={
+                    "stage": pl.Utf8,
+                    "call": pl.Int64,
+                    "seconds": pl.Float64,
+                    "peak_bytes": pl.Int64,
+                    "retained_bytes": pl.Int64,
+                },
+            )
+            allocations = pl.DataFrame(
+                [
+                    {"stage": stage, "location": location, "bytes": size}
+                    for stage, sizes in self.allocations.items()
+                    for location, size in sizes.most_common(TOP_ALLOCATORS)
+                ],
+                schema={"stage": pl.Utf8, "location": pl.Utf8, "bytes": pl.Int64},
+            )
+
+        calls.write_csv(self.output_dir / "calls.csv")
+        calls.group_by("stage").agg(
+            pl.len().alias("calls"),
+            pl.col("seconds").sum().alias("total_seconds"),
+            pl.col("seconds").mean().alias("mean_seconds"),
+            pl.col("seconds").max().alias("max_seconds"),
+            pl.col("peak_bytes").max().alias("peak_bytes"),
+        ).sort("total_seconds", descending=True).write_csv(self.output_dir / "stages.csv")
+        allocations.write_csv(self.output_dir / "allocations.csv")
+
+
+_profiler: _Profiler | None = None
+
+
+def enable_profiling(output_dir: str):
+    """
+    Start profiling stages wrapped with @profiled, writing reports to output_dir on exit.
+
+    Args:
+        output_dir: Directory to write the profiling reports to
+    """
+    global _profiler
+    if _profiler is not None:
+        return
+
+    _profiler = _Profiler(output_dir)
+    _profiler.start()
+    atexit.register(write_reports)
+
+
+def profiling_dir() -> str | None:
+    """Directory the reports are written to, or None if profiling is off."""
+    return str(_profiler.output_dir) if _profiler is not None else None
+
+
+def write_reports():
+    """Stop profiling and write the reports collected so far."""
+    global _profiler
+    if _profiler is None:
+        return
+
+    profiler, _profiler = _profiler, None
+    profiler.stop()
+    profiler.write_reports()
+
+
+@contextmanager
+def profiling_to(output_dir: str) -> Iterator[None]:
+    """
+    Profile a block on its own, writing its reports to output_dir when it ends.
+
+    For worker processes, which exit without running atexit handlers and so would never write
+    the reports of profiling enabled through DONATIONS_PROFILE_DIR. Profiling inherited that way
+    is discarded.
+
+    Args:
+        output_dir: Directory to write the block's profiling reports to
+    """
+    global _profiler
+    inherited, _profiler = _profiler, _Profiler(output_dir)
+    if inherited is not None:
+        inherited.stop()
+    _profiler.start()
+    try:
+        yield
+    finally:
+        write_reports()
+
+
+@contextmanager
+def profile_stage(stage: str, allocations: bool = True) -> Iterator[None]:
+    """
+    Profile a block of code as one call of stage.
+
+    Args:
+        stage: Stage name used in the reports
+        allocations: Whether to diff tracemalloc snapshots to find the top allocators. Snapshots are
+            slow, so turn this off for stages called per row.
+    """
+    if _profiler is None:
+        yield
+        return
+
+    profiler = _profiler
+    call = profiler.enter(stage, allocations)
+    try:
+        yield
+    finally:
+        profiler.exit(call)
+
+
+def profiled(stage: str, allocations: bool = True) -> Callable:
+    """Decorator profiling every call of the wrapped function as stage, see profile_stage."""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return func(*args, **kwargs)
+            with profile_stage(stage, allocations):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+if os.environ.get(PROFILE_DIR_ENV):
+    enable_profiling(os.environ[PROFILE_DIR_ENV])
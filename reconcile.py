@@ -0,0 +1,178 @@
+"""
+Reconcile donation receipts against the approved organization listings.
+
+Each receipt (reference number, payee name, receipt date) is joined against every
+section by reference number, falling back to normalized payee name, and checked
+against the approval window of the matched listing. The whole reconciliation is one
+lazy polars query, so large receipt files are streamed rather than loaded up front.
+"""
+
+import polars as pl
+
+from config import SECTION_FILES
+from normalize import normalize_name_expr
+
+
+def _listings(section_files: dict[str, str]) -> pl.LazyFrame:
+    frames = [
+        pl.scan_csv(path, infer_schema=False).select(
+            pl.lit(section).alias("matched_section"),
+            pl.col("reference_num").str.strip_chars().alias("matched_reference_num"),
+            pl.col("organization").alias("matched_organization"),
+            normalize_name_expr(pl.col("organization")).alias("_listing_name_key"),
+            pl.col("start_date").str.to_date("%Y-%m-%d").alias("matched_start_date"),
+            pl.col("end_date").str.to_date("%Y-%m-%d").alias("matched_end_date"),
+            pl.col("status").alias("matched_status"),
+        )
+        for section, path in section_files.items()
+    ]
+    return pl.concat(frames)
+
+
+def reconcile_receipts(
+    receipts_path: str,
+    output_path: str,
+    reference_col: str = "reference_num",
+    name_col: str = "payee_name",
+    date_col: str = "receipt_date",
+    date_format: str | None = None,
+    section_files: dict[str, str] = SECTION_FILES,
+    verbose: bool = True,
+) -> pl.DataFrame:
+    """
+    Match receipts to approved organizations and write a match report.
+
+    A receipt is matched on reference number first and on normalized payee name only if
+    no listing has its reference number. When several listings match, the one whose
+    approval window covers the receipt date wins, preferring a non-revoked listing with
+    the same name. The report keeps every receipt column and adds:
+
+    - match_status: matched, revoked (date in window of a revoked approval), outside_window,
+      invalid_date (the receipt date is missing or does not parse) or unmatched
+    - match_method: reference or name
+    - matched_section, matched_reference_num, matched_organization, matched_start_date,
+      matched_end_date, matched_status: the matched listing
+    - name_mismatch: the reference matched but the listing is under a different name
+
+    Args:
+        receipts_path: Path to the receipts CSV file
+        output_path: Path to write the match report CSV to
+        reference_col: Receipt column holding the approval reference number
+        name_col: Receipt column holding the payee name
+        date_col: Receipt column holding the receipt date
+        date_format: strftime format of the receipt dates (inferred if None)
+        section_files: Merged section CSVs to reconcile against, keyed by section
+        verbose: Whether to print a summary of match statuses
+
+    Returns:
+        Count of receipts per match_status
+    """
+    receipts = pl.scan_csv(receipts_path, infer_schema=False).with_row_index("_receipt_id")
+    keys = receipts.select(
+        "_receipt_id",
+        pl.col(reference_col).str.strip_chars().alias("_reference_num"),
+        normalize_name_expr(pl.col(name_col)).alias("_name_key"),
+        pl.col(date_col).str.to_date(date_format, strict=False).alias("_receipt_date"),
+    )
+    listings = _listings(section_files)
+
+    by_reference = keys.join(
+        listings, left_on="_reference_num", right_on="matched_reference_num", how="inner", coalesce=False
+    ).with_columns(pl.lit("reference").alias("match_method"))
+    by_name = (
+        keys.join(by_reference.select("_receipt_id").unique(), on="_receipt_id", how="anti")
+        .filter(pl.col("_name_key") != "")
+        .join(listings, left_on="_name_key", right_on="_listing_name_key", how="inner", coalesce=False)
+        .with_columns(pl.lit("name").alias("match_method"))
+    )
+
+    in_window = pl.col("_receipt_date").is_between(pl.col("matched_start_date"), pl.col("matched_end_date"))
+    revoked = pl.col("matched_status") == "revoked"
+    name_mismatch = (pl.col("match_method") == "reference") & (pl.col("_name_key") != pl.col("_listing_name_key"))
+    best = (
+        pl.concat([by_reference, by_name], how="diagonal")
+        .with_columns(
+            pl.when(pl.col("_receipt_date").is_null())
+            .then(pl.lit("invalid_date"))
+            .when(in_window & ~revoked)
+            .then(pl.lit("matched"))
+            .when(in_window)
+            .then(pl.lit("revoked"))
+            .otherwise(pl.lit("outside_window"))
+            .alias("match_status"),
+            name_mismatch.fill_null(False).alias("name_mismatch"),
+            # Lower is better: a covering window first, then not revoked, then the same name
+            (
+                (~in_window.fill_null(False)).cast(pl.Int8) * 4
+                + revoked.cast(pl.Int8) * 2
+                + name_mismatch.fill_null(False).cast(pl.Int8)
+            ).alias("_rank"),
+        )
+        # Remaining ties (same organization listed twice) are broken deterministically
+        .sort(
+            "_receipt_id",
+            "_rank",
+            "matched_end_date",
+            "matched_organization",
+            "matched_section",
+            "matched_reference_num",
+            descending=[False, False, True, False, False, False],
+        )
+        .unique("_receipt_id", keep="first", maintain_order=False)
+        .select(
+            "_receipt_id",
+            "match_status",
+            "match_method",
+            "matched_section",
+            "matched_reference_num",
+            "matched_organization",
+            "matched_start_date",
+            "matched_end_date",
+            "matched_status",
+            "name_mismatch",
+        )
+    )
+
+    report = (
+        receipts.join(best, on="_receipt_id", how="left")
+        .with_columns(pl.col("match_status").fill_null("unmatched"))
+        .sort("_receipt_id")
+        .drop("_receipt_id")
+    )
+    report.sink_csv(output_path)
+
+    summary = (
+        pl.scan_csv(output_path, infer_schema=False)
+        .group_by("match_status")
+        .len()
+        .collect()
+        .sort("len", descending=True)
+    )
+    if verbose:
+        print(f"Reconciled {summary['len'].sum()} receipts from {receipts_path}")
+        print(summary)
+        print(f"Saved to {output_path}")
+
+    return summary
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Reconcile donation receipts against approved organizations.")
+    parser.add_argument("receipts_file", help="Path to receipts CSV file")
+    parser.add_argument("output_file", help="Path to write the match report CSV to")
+    parser.add_argument("--reference-col", default="reference_num", help="Column with the approval reference number")
+    parser.add_argument("--name-col", default="payee_name", help="Column with the payee name")
+    parser.add_argument("--date-col", default="receipt_date", help="Column with the receipt date")
+    parser.add_argument("--date-format", default=None, help="strftime format of receipt dates (default: inferred)")
+    args = parser.parse_args()
+
+    reconcile_receipts(
+        args.receipts_file,
+        args.output_file,
+        args.reference_col,
+        args.name_col,
+        args.date_col,
+        args.date_format,
+    )
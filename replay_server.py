@@ -0,0 +1,204 @@
+"""
+Local stand-in for the hasil.gov.my donation approval pages.
+
+Serves the saved snapshots/ pages behind the same URLs the scraper uses, so that
+pipeline.py can be run offline by pointing HASIL_BASE_URL at this server. Latency,
+jitter and error injection make it possible to reproduce slow or flaky runs.
+"""
+
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+SNAPSHOTS_PATH = "./snapshots"
+
+# Listing URL path for each section, as requested by pipeline.py
+SECTION_PATHS = {
+    "446": "/en/quick-links/services/donation-approval/subsection-44-6-of-the-income-tax-act-1967/",
+    "11D": "/en/quick-links/services/donation-approval/subsection-44-11d-of-the-income-tax-act-1967/",
+    "PUA": "/en/quick-links/services/donation-approval/pu-a-1392020/",
+}
+
+# save_page_html names snapshots after the section ("446"), while older snapshots use the
+# subsection number ("44_6"), so both are accepted
+SNAPSHOT_PREFIXES = {"446": ["44_6", "446"], "11D": ["11D"], "PUA": ["PUA"]}
+
+
+@lru_cache(maxsize=None)
+def load_snapshot(snapshots_path: str, section: str, page_num: int) -> bytes | None:
+    """
+    Read a section's snapshot page once, returning None if it was never saved.
+
+    Some snapshots were saved under the wrong section, such as a P.U.(A) page saved as 44(6)
+    page 1. A page belongs to a section if its search form posts back to that section's URL,
+    so pages of other sections are skipped.
+    """
+    for prefix in SNAPSHOT_PREFIXES[section]:
+        path = Path(snapshots_path) / f"subsection_{prefix}_page{page_num}.html"
+        if path.exists() and has_search_form(content := path.read_bytes(), section):
+            return content
+    return None
+
+
+def has_search_form(content: bytes, section: str) -> bool:
+    """Whether a page has the search form of section, which posts back to the section's listing URL."""
+    return f'action="{SECTION_PATHS[section]}"'.encode() in content
+
+
+def search_form_page(section: str, snapshots_path: str = SNAPSHOTS_PATH) -> int:
+    """
+    Number of the first snapshot page of a section, which is served as its search form.
+
+    Raises:
+        FileNotFoundError: No snapshot has the section's search form, so the scraper could not
+            get past it
+    """
+    pages = available_pages(section, snapshots_path)
+    if not pages:
+        raise FileNotFoundError(f"No snapshot in {snapshots_path} has the {section} search form")
+    return pages[0]
+
+
+def make_handler(
+    snapshots_path: str = SNAPSHOTS_PATH,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+) -> type[BaseHTTPRequestHandler]:
+    """
+    Build a request handler serving snapshots with injected faults.
+
+    Args:
+        snapshots_path: Directory containing subsection_<section>_page<N>.html files
+        latency: Seconds added to every listing page response
+        jitter: Maximum extra random seconds added on top of latency
+        error_rate: Probability (0-1) that a listing page request fails with a 503
+
+    Returns:
+        Handler class for an http.server server
+    """
+    # Found once, since finding a section's search form reads all of its snapshots
+    form_pages: dict[str, int | FileNotFoundError] = {}
+    for section in SECTION_PATHS:
+        try:
+            form_pages[section] = search_form_page(section, snapshots_path)
+        except FileNotFoundError as e:
+            form_pages[section] = e
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            page = parse_qs(url.query).get("page")
+            # The scraper first opens the listing URL without a page to fill in the search form
+            self._serve_listing(url.path, int(page[0]) if page else None)
+
+        def do_POST(self):
+            # The search form posts back to the listing URL, which shows the form again
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._serve_listing(urlparse(self.path).path, None)
+
+        def _serve_listing(self, path: str, page_num: int | None):
+            section = next((section for section, p in SECTION_PATHS.items() if p == path), None)
+            if section is None:
+                # Stylesheets, scripts and images referenced by the snapshots are not kept
+                self.send_error(404)
+                return
+
+            time.sleep(latency + random.uniform(0, jitter))
+            if random.random() < error_rate:
+                self.send_error(503, "Injected error")
+                return
+
+            if page_num is None:
+                page_num = form_pages[section]
+                if isinstance(page_num, FileNotFoundError):
+                    self.log_error("%s", page_num)
+                    self.send_error(404, str(page_num))
+                    return
+
+            content = load_snapshot(snapshots_path, section, page_num)
+            if content is None:
+                self.send_error(404, f"No {section} snapshot for page {page_num}")
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ReplayHandler
+
+
+def start_server(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    snapshots_path: str = SNAPSHOTS_PATH,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+) -> ThreadingHTTPServer:
+    """
+    Start the replay server on a background thread.
+
+    Args:
+        host: Interface to bind to
+        port: Port to bind to (0 picks a free port)
+        snapshots_path: Directory containing the saved snapshot pages
+        latency: Seconds added to every listing page response
+        jitter: Maximum extra random seconds added on top of latency
+        error_rate: Probability (0-1) that a listing page request fails with a 503
+
+    Returns:
+        Running server, call shutdown() to stop it
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(snapshots_path, latency, jitter, error_rate))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def available_pages(section: str, snapshots_path: str = SNAPSHOTS_PATH) -> list[int]:
+    """Page numbers of a section that have a saved snapshot of that section."""
+    pages = set()
+    for prefix in SNAPSHOT_PREFIXES[section]:
+        for path in Path(snapshots_path).glob(f"subsection_{prefix}_page*.html"):
+            if match := re.search(r"page(\d+)\.html$", path.name):
+                pages.add(int(match.group(1)))
+    return sorted(page for page in pages if load_snapshot(snapshots_path, section, page) is not None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve saved snapshots in place of hasil.gov.my.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--snapshots", default=SNAPSHOTS_PATH, help="Directory of saved snapshot pages")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every page response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Maximum random seconds added on top of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability a page request fails with a 503")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        (args.host, args.port), make_handler(args.snapshots, args.latency, args.jitter, args.error_rate)
+    )
+    for section in SECTION_PATHS:
+        try:
+            print(f"Serving page {search_form_page(section, args.snapshots)} as the {section} search form")
+        except FileNotFoundError as e:
+            print(f"Warning: {e}, so {section} cannot be scraped")
+    print(f"Replaying {args.snapshots} on http://{args.host}:{args.port}")
+    print(f"Run the scraper with HASIL_BASE_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,37 @@
+import polars as pl
+import pytest
+
+from categorize_organizations import categorize_csv_file, categorize_csv_file_streaming, categorize_csv_files
+
+
+def test_categorize_csv_files_rejects_inputs_sharing_an_output(tmp_path):
+    for directory in ["a", "b"]:
+        (tmp_path / directory).mkdir()
+        pl.DataFrame({"organization": ["HOSPIS MELAKA"]}).write_csv(tmp_path / directory / "x.csv")
+
+    with pytest.raises(ValueError, match="x.csv"):
+        categorize_csv_files(
+            [str(tmp_path / "a" / "x.csv"), str(tmp_path / "b" / "x.csv")], str(tmp_path / "out"), verbose=False
+        )
+    assert not (tmp_path / "out").exists()
+
+
+def test_categorize_csv_file_is_idempotent(tmp_path):
+    path = tmp_path / "orgs.csv"
+    pl.DataFrame({"organization": ["HOSPIS MELAKA", "MASJID JAMEK"]}).write_csv(path)
+
+    first = categorize_csv_file(str(path), verbose=False)
+    second = categorize_csv_file(str(path), verbose=False)
+
+    assert second.columns == ["organization", "category"]
+    assert second.equals(first)
+
+
+def test_streaming_matches_eager_across_chunks(tmp_path):
+    path = tmp_path / "orgs.csv"
+    pl.DataFrame({"organization": ["HOSPIS MELAKA", "MASJID JAMEK", "SEKOLAH SERI", "KELAB SUKAN"]}).write_csv(path)
+
+    eager = categorize_csv_file(str(path), str(tmp_path / "eager.csv"), verbose=False)
+    categorize_csv_file_streaming(str(path), str(tmp_path / "streamed.csv"), chunk_size=3, verbose=False)
+
+    assert pl.read_csv(tmp_path / "streamed.csv").equals(eager)
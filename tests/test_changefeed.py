@@ -0,0 +1,60 @@
+import polars as pl
+import pytest
+
+from categorize_organizations import categorize_csv_file, categorize_csv_file_streaming
+from facets import LOCATION_SCHEMA
+from pipeline import diff_orgs, merge_orgs
+
+ROWS = {
+    "reference_num": [8102, 8102, 8291],
+    "organization": [
+        "TABUNG PENGURUSAN RUMAH IBADAT GEREJA PRESBYTERIAN HOLY LIGHT",
+        "TABUNG PENGURUSAN RUMAH IBADAT GEREJA PRESBYTERIAN HOLY LIGHT",
+        "PERSATUAN HOSPIS MELAKA",
+    ],
+    "address": [
+        "11 JALAN GERTAK MERAH 80000 JOHOR BAHRU JOHOR",
+        "11 JALAN GERTAK MERAH 80000 JOHOR BAHRU JOHOR",
+        "NO 2 JALAN BUKIT BARU 75150 MELAKA",
+    ],
+    "category": ["TABUNG PENGURUSAN RUMAH IBADAT (TPRI)", "TABUNG PENGURUSAN RUMAH IBADAT (TPRI)", "KEBAJIKAN"],
+    "start_date": ["2016-04-15", "2026-01-01", "2020-01-01"],
+    "end_date": ["2025-12-31", "2035-12-31", "2029-12-31"],
+    "status": ["rejected", "approved", "approved"],
+    "remarks": [None, None, None],
+}
+
+
+def _merge(thread: pl.DataFrame, tmp_path, save_path) -> pl.DataFrame:
+    thread_path = tmp_path / "thread_1.csv"
+    thread.write_csv(thread_path)
+    merge_orgs([str(thread_path)], str(save_path))
+    return pl.read_csv(save_path, schema_overrides=LOCATION_SCHEMA)
+
+
+@pytest.mark.parametrize("categorize", [categorize_csv_file, categorize_csv_file_streaming])
+def test_remerge_after_categorize_has_no_changes(tmp_path, categorize):
+    merged = tmp_path / "merged.csv"
+    _merge(pl.DataFrame(ROWS), tmp_path, merged)
+    categorize(str(merged), verbose=False)
+    previous = pl.read_csv(merged, schema_overrides=LOCATION_SCHEMA)
+
+    current = _merge(pl.DataFrame(ROWS), tmp_path, merged)
+
+    assert previous["classification"].to_list() == ROWS["category"]
+    assert diff_orgs(previous, current).is_empty()
+
+
+def test_remerge_after_categorize_reports_changed_category(tmp_path):
+    merged = tmp_path / "merged.csv"
+    _merge(pl.DataFrame(ROWS), tmp_path, merged)
+    categorize_csv_file(str(merged), verbose=False)
+    previous = pl.read_csv(merged, schema_overrides=LOCATION_SCHEMA)
+
+    changed = pl.DataFrame(ROWS).with_columns(
+        pl.when(pl.col("reference_num") == 8291).then(pl.lit("PERUBATAN")).otherwise("category").alias("category")
+    )
+    current = _merge(changed, tmp_path, merged)
+
+    changes = diff_orgs(previous, current)
+    assert changes.select("reference_num", "change_type", "changed_fields").rows() == [("8291", "updated", "category")]
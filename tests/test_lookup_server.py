@@ -0,0 +1,69 @@
+from datetime import date
+
+import polars as pl
+import pytest
+
+from lookup_server import LookupIndex, lookup_args
+
+
+def test_lookup_args_coerces_numeric_reference_and_parses_date():
+    assert lookup_args({"reference_num": 8102, "date": "2026-01-31"}) == {
+        "reference_num": "8102",
+        "name": None,
+        "section": None,
+        "on_date": date(2026, 1, 31),
+    }
+
+
+@pytest.mark.parametrize(
+    "item, error",
+    [
+        ({"name": 123}, "name must be a string"),
+        ({"reference_num": "8102", "date": 20260101}, "date must be a string"),
+        ({"reference_num": "8102", "date": "01/02/2026"}, "date must be an ISO date"),
+        ({"reference_num": "8102", "section": "44(6)"}, "section must be one of"),
+        ({"section": "446"}, "reference_num or name is required"),
+    ],
+)
+def test_lookup_args_rejects_invalid_items(item, error):
+    with pytest.raises(ValueError, match=error):
+        lookup_args(item)
+
+
+@pytest.fixture
+def shared_reference_index(tmp_path):
+    # Reference numbers are reused across organizations, as "2" is in the 44(6) listing
+    path = tmp_path / "446.csv"
+    pl.DataFrame(
+        {
+            "reference_num": ["2", "2", "8102"],
+            "organization": ["HOSPIS MELAKA", "MASJID JAMEK", "PERSATUAN HOSPIS TAWAU"],
+            "start_date": ["2020-01-01", "2020-01-01", "2020-01-01"],
+            "end_date": ["2030-12-31", "2030-12-31", "2030-12-31"],
+            "status": ["approved", "approved", "approved"],
+        }
+    ).write_csv(path)
+    return LookupIndex.load({"446": str(path)})
+
+
+def test_lookup_shared_reference_is_not_approved_without_a_name(shared_reference_index):
+    result = shared_reference_index.lookup(reference_num="2", on_date=date(2026, 1, 31))
+
+    assert result["ambiguous"]
+    assert not result["approved"]
+    assert [match["approved"] for match in result["matches"]] == [True, True]
+
+
+def test_lookup_shared_reference_is_narrowed_by_name(shared_reference_index):
+    result = shared_reference_index.lookup(reference_num="2", name="Hospis Melaka", on_date=date(2026, 1, 31))
+
+    assert result["approved"]
+    assert [match["organization"] for match in result["matches"]] == ["HOSPIS MELAKA"]
+
+
+def test_lookup_shared_reference_with_another_name_is_a_mismatch(shared_reference_index):
+    result = shared_reference_index.lookup(reference_num="2", name="Bogus Charity", on_date=date(2026, 1, 31))
+
+    assert result["name_mismatch"]
+    assert not result["approved"]
+    assert len(result["matches"]) == 2
@@ -0,0 +1,35 @@
+import polars as pl
+
+from reconcile import reconcile_receipts
+
+
+def test_reconcile_receipts_reports_invalid_dates_and_keeps_receipt_columns(tmp_path):
+    listings = tmp_path / "listings.csv"
+    pl.DataFrame(
+        {
+            "reference_num": ["8102"],
+            "organization": ["PERSATUAN HOSPIS MELAKA"],
+            "start_date": ["2026-01-01"],
+            "end_date": ["2035-12-31"],
+            "status": ["approved"],
+        }
+    ).write_csv(listings)
+    receipts = tmp_path / "receipts.csv"
+    pl.DataFrame(
+        {
+            "reference_num": ["8102", "8102", "8102", "8102"],
+            "payee_name": ["Persatuan Hospis Melaka"] * 4,
+            "receipt_date": ["2026-02-01", "2040-01-01", "not a date", None],
+            "status": ["paid"] * 4,
+        }
+    ).write_csv(receipts)
+    report_path = tmp_path / "report.csv"
+
+    reconcile_receipts(
+        str(receipts), str(report_path), date_format="%Y-%m-%d", section_files={"446": str(listings)}, verbose=False
+    )
+
+    report = pl.read_csv(report_path, infer_schema=False)
+    assert report["match_status"].to_list() == ["matched", "outside_window", "invalid_date", "invalid_date"]
+    assert report["status"].to_list() == ["paid"] * 4
+    assert report["matched_status"].to_list() == ["approved"] * 4
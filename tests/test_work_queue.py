@@ -0,0 +1,22 @@
+from work_queue import PageQueue
+
+
+def test_has_unfinished_only_counts_the_workers_section(tmp_path):
+    queue = PageQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue("11D", [1])
+    queue.enqueue("446", [1, 2])
+
+    section, pages = queue.lease("worker", section="11D")
+    assert queue.complete("worker", section, pages[0], "thread_1.csv")
+
+    assert queue.lease("worker", section="11D") is None
+    assert not queue.has_unfinished("11D")
+    assert queue.has_unfinished("446")
+    assert queue.has_unfinished()
+    queue.close()
+
+
+def test_queue_uses_rollback_journal(tmp_path):
+    queue = PageQueue(str(tmp_path / "queue.sqlite"))
+    assert queue.connection.execute("PRAGMA journal_mode").fetchone() == ("delete",)
+    queue.close()
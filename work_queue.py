@@ -0,0 +1,262 @@
+"""
+Durable page-lease work queue for scraping across processes and hosts.
+
+Pages of every section are tracked in a SQLite file. Workers lease a batch of pages,
+scrape them with pipeline.py's scrape_subsection and mark each page done as soon as it
+is saved. A lease expires if its worker stops renewing it, so pages held by a crashed
+worker are leased again by the others. Several hosts can share the queue by pointing
+at the same file on a volume whose POSIX file locks work across hosts, which many
+network filesystems do not provide; SQLite's docs advise against using them.
+"""
+
+import asyncio
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+QUEUE_PATH = "./work_queue.sqlite"
+LEASE_SECONDS = 300.0
+MAX_ATTEMPTS = 3
+IDLE_WAIT = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    section TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending, leased, done or failed
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result_path TEXT,
+    completed_at REAL,
+    PRIMARY KEY (section, page)
+);
+CREATE INDEX IF NOT EXISTS pages_status ON pages (status, lease_expires);
+"""
+
+
+class PageQueue:
+    """Page leases and completion records for every section, stored in a SQLite file."""
+
+    def __init__(self, path: str = QUEUE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        # WAL needs memory shared between processes on one host, so it breaks when hosts share the file.
+        # The rollback journal only needs file locks, and converts queue files created in WAL mode.
+        self.connection.execute("PRAGMA journal_mode=DELETE")
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # IMMEDIATE takes the write lock up front, so two workers can never lease the same page
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+    def enqueue(self, section: str, pages: list[int]) -> int:
+        """Add pages of a section to the queue, skipping pages already queued. Returns how many were added."""
+        with self._transaction() as connection:
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO pages (section, page) VALUES (?, ?)", [(section, page) for page in pages]
+            )
+            return cursor.rowcount
+
+    def lease(
+        self,
+        worker_id: str,
+        batch: int = 10,
+        section: str | None = None,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+    ) -> tuple[str, list[int]] | None:
+        """
+        Lease up to batch pages of one section, taking pending pages and pages whose lease expired.
+
+        Args:
+            worker_id: Unique name of the leasing worker
+            batch: Maximum number of pages to lease
+            section: Only lease pages of this section
+            lease_seconds: Seconds until the lease expires unless renewed
+            max_attempts: Expired pages already leased this many times are marked failed instead
+
+        Returns:
+            Section and sorted page numbers leased, or None if nothing is available
+        """
+        now = time.time()
+        available = "(status = 'pending' OR (status = 'leased' AND lease_expires < ?))"
+        with self._transaction() as connection:
+            # A page that keeps taking its worker down would otherwise be leased forever
+            connection.execute(
+                "UPDATE pages SET status = 'failed', lease_owner = NULL "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, max_attempts),
+            )
+            row = connection.execute(
+                f"SELECT section FROM pages WHERE {available} AND (? IS NULL OR section = ?) ORDER BY section LIMIT 1",
+                (now, section, section),
+            ).fetchone()
+            if row is None:
+                return None
+
+            leased_section = row[0]
+            pages = [
+                page
+                for (page,) in connection.execute(
+                    f"SELECT page FROM pages WHERE {available} AND section = ? ORDER BY page LIMIT ?",
+                    (now, leased_section, batch),
+                )
+            ]
+            connection.executemany(
+                "UPDATE pages SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE section = ? AND page = ?",
+                [(worker_id, now + lease_seconds, leased_section, page) for page in pages],
+            )
+            return leased_section, pages
+
+    def renew(self, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> int:
+        """Extend every lease held by worker_id. Returns how many leases were extended."""
+        with self._transaction() as connection:
+            return connection.execute(
+                "UPDATE pages SET lease_expires = ? WHERE status = 'leased' AND lease_owner = ?",
+                (time.time() + lease_seconds, worker_id),
+            ).rowcount
+
+    def complete(self, worker_id: str, section: str, page: int, result_path: str) -> bool:
+        """Record a page as done. Returns False if the lease was lost to another worker in the meantime."""
+        with self._transaction() as connection:
+            return (
+                connection.execute(
+                    "UPDATE pages SET status = 'done', result_path = ?, completed_at = ?, lease_owner = NULL "
+                    "WHERE section = ? AND page = ? AND status = 'leased' AND lease_owner = ?",
+                    (str(result_path), time.time(), section, page, worker_id),
+                ).rowcount
+                == 1
+            )
+
+    def release(self, worker_id: str, section: str, pages: list[int], max_attempts: int = MAX_ATTEMPTS):
+        """Hand unfinished pages back to the queue, marking pages that used up max_attempts as failed."""
+        with self._transaction() as connection:
+            connection.executemany(
+                "UPDATE pages SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "lease_owner = NULL, lease_expires = NULL "
+                "WHERE section = ? AND page = ? AND status = 'leased' AND lease_owner = ?",
+                [(max_attempts, section, page, worker_id) for page in pages],
+            )
+
+    def has_unfinished(self, section: str | None = None) -> bool:
+        """Whether any page (of section, if given) is still pending or leased."""
+        row = self.connection.execute(
+            "SELECT 1 FROM pages WHERE status IN ('pending', 'leased') AND (? IS NULL OR section = ?) LIMIT 1",
+            (section, section),
+        ).fetchone()
+        return row is not None
+
+    def stats(self) -> dict[tuple[str, str], int]:
+        """Number of pages per (section, status)."""
+        rows = self.connection.execute("SELECT section, status, COUNT(*) FROM pages GROUP BY section, status")
+        return {(section, status): count for section, status, count in rows}
+
+    def close(self):
+        self.connection.close()
+
+
+async def run_worker(
+    queue: PageQueue,
+    worker_id: str,
+    batch: int = 10,
+    section: str | None = None,
+    lease_seconds: float = LEASE_SECONDS,
+    save_snapshot: bool = False,
+    table_only: bool = False,
+):
+    """
+    Lease and scrape pages until the queue has nothing left to do.
+
+    Args:
+        queue: Queue to lease pages from
+        worker_id: Unique name of this worker
+        batch: Pages leased, and scraped with one browser, at a time
+        section: Only scrape pages of this section
+        lease_seconds: Seconds a lease lasts; renewed after every scraped page
+        save_snapshot: Whether to save each page's html to snapshots/
+        table_only: Extract, save and parse only the results table of each page
+    """
+    from pipeline import app
+
+    _, defs = app.run()
+    scrape_subsection = defs["scrape_subsection"]
+
+    while True:
+        leased = queue.lease(worker_id, batch, section, lease_seconds)
+        if leased is None:
+            if not queue.has_unfinished(section):
+                return
+            # Other workers hold the remaining pages; wait in case their leases expire
+            await asyncio.sleep(IDLE_WAIT)
+            continue
+
+        leased_section, pages = leased
+        done: set[int] = set()
+
+        # Bound as defaults so the callback keeps this batch's section and pages
+        def on_page_scraped(page: int, path: str, leased_section: str = leased_section, done: set[int] = done):
+            if queue.complete(worker_id, leased_section, page, path):
+                done.add(page)
+            queue.renew(worker_id, lease_seconds)
+
+        try:
+            await scrape_subsection(
+                section=leased_section,
+                pages=pages,
+                save_snapshot=save_snapshot,
+                table_only=table_only,
+                on_page_scraped=on_page_scraped,
+            )
+        finally:
+            queue.release(worker_id, leased_section, [page for page in pages if page not in done])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Distributed page-lease work queue for the scraper.")
+    parser.add_argument("--queue", default=QUEUE_PATH, help="Path to the SQLite queue file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Queue pages of a section")
+    enqueue_parser.add_argument("section", choices=["446", "11D", "PUA"])
+    enqueue_parser.add_argument("page_start", type=int)
+    enqueue_parser.add_argument("page_end", type=int)
+
+    work_parser = commands.add_parser("work", help="Lease and scrape pages until the queue is drained")
+    work_parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    work_parser.add_argument("--batch", type=int, default=10, help="Pages leased at a time")
+    work_parser.add_argument("--section", choices=["446", "11D", "PUA"], default=None)
+    work_parser.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    work_parser.add_argument("--save-snapshot", action="store_true")
+    work_parser.add_argument("--table-only", action="store_true", help="Extract only the results table in the browser")
+
+    commands.add_parser("status", help="Show page counts per section and status")
+    args = parser.parse_args()
+
+    queue = PageQueue(args.queue)
+    if args.command == "enqueue":
+        added = queue.enqueue(args.section, list(range(args.page_start, args.page_end + 1)))
+        print(f"Queued {added} pages of {args.section}")
+    elif args.command == "work":
+        asyncio.run(
+            run_worker(
+                queue, args.worker_id, args.batch, args.section, args.lease_seconds, args.save_snapshot, args.table_only
+            )
+        )
+    else:
+        for (section, status), count in sorted(queue.stats().items()):
+            print(f"{section}\t{status}\t{count}")
+    queue.close()